@@ -2,12 +2,13 @@
 Read transitions from ORCA output file and analyze their composition in terms of AO composition (e.g. Co s, Co px, py, pz, ...) of the contributing MO
 """
 
+import mmap
 import os
 import re
 import sys
+import numba
 import numpy as np
 import matplotlib.pyplot as plt
-import scipy.special
 
 file_mos = r'/huge/ebbo/CoVT/DATA_Jul26/VtC/better_analysis/ref_acac/ref_acac_Co3_read.out' 
 file_transitions = r'/huge/ebbo/CoVT/DATA_Jul26/VtC/better_analysis/ref_acac/acac_Co3.out'
@@ -17,7 +18,8 @@ bx_plot, by_plot = np.loadtxt('acac_Co3.out.xessoc.dat', usecols=(0,1), unpack=T
 def filter_spectra(
 x,
 y_arr,
-digits = 0
+digits = 0,
+max_bins = 1000000
 ):
     """
     Take an energy axis *x* and an n-dimensional array *y_arr* and group entries which are close in energy along *x*. The energy axis has to align with the first dimension of *y_arr*.
@@ -27,25 +29,93 @@ digits = 0
     digits = 0    # All sticks which are within 1 eV are grouped
     digits = 1    # All sticks which are within 0.1 eV are grouped
     ...
+
+    If the quantized energy range spans fewer than *max_bins* bins, the groups are found with a lookup table instead of
+    sorting.
     """
 
-    x = np.round(x, digits)
-    arr = np.array(y_arr)
+    arr = np.asarray(y_arr)
+    if len(arr) == 0:
+        # Nothing to group, hand back empty arrays of the expected shapes
+        return np.zeros(0), arr.copy()
+
+    # Map every stick onto an integer bin index, so grouping becomes a histogram
+    scale = 10.0**digits
+    ints = np.rint(np.asarray(x) * scale).astype(np.int64)
+    offset = ints.min()
+    ints -= offset
+
+    flat = arr.reshape(arr.shape[0], -1)
+
+    if ints.max() < max_bins:
+        # Lookup table over the (small) integer range, no sorting required
+        table = np.zeros(ints.max() + 1, dtype = bool)
+        table[ints] = True
+        values = np.nonzero(table)[0]
+        inverse = np.cumsum(table)[ints] - 1
+    else:
+        # Range too large for a table, fall back to sorting
+        values, inverse = np.unique(ints, return_inverse = True)
+
+    filtered_array = np.stack([np.bincount(inverse, weights = col, minlength = len(values)) for col in flat.T], axis = -1)
+    filtered_array = filtered_array.reshape((-1,) + arr.shape[1:]).astype(arr.dtype, copy = False)
+    x_filtered = (values + offset) / scale
 
-    # Sort the arrays according to x
-    sort_idx = np.argsort(x)
-    sorted_a = arr[sort_idx]
-    x = x[sort_idx]
+    return x_filtered, filtered_array
 
-    values, indices, counts = np.unique(x, return_index = True, return_counts = True)
 
-    x_filtered = np.empty(values.shape)
-    filtered_array = np.empty((values.shape[0],) + sorted_a.shape[1:])
-    for idx, (v, i, c) in enumerate(zip(values, indices, counts)):
-        x_filtered[idx] = v
-        filtered_array[idx] = np.sum(sorted_a[i:(i+c)], axis = 0)
+@numba.njit(fastmath = True, cache = True)
+def _voigt_humlicek(
+dx,
+sigma,
+gamma
+):
+    """
+    Evaluate a normalized voigt profile at the offset *dx* with Humlicek's (1982) W4 rational approximation of the
+    Faddeeva function. For *sigma* = 0 the profile reduces to a pure Lorentzian, which is evaluated in closed form.
+    """
 
-    return x_filtered, filtered_array
+    if sigma == 0:
+        return gamma / np.pi / (dx**2 + gamma**2)
+
+    inv_sigma_sqrt2 = 1.0 / (sigma * np.sqrt(2))
+    X = dx * inv_sigma_sqrt2
+    Y = gamma * inv_sigma_sqrt2
+    t = Y - 1j * X
+    s = abs(X) + Y
+
+    if s >= 15:
+        w = t * 0.5641896 / (0.5 + t*t)
+    elif s >= 5.5:
+        u = t*t
+        w = t * (1.410474 + u*0.5641896) / (0.75 + u*(3 + u))
+    elif Y >= 0.195 * abs(X) - 0.176:
+        w = ((16.4955 + t*(20.20933 + t*(11.96482 + t*(3.778987 + t*0.5642236))))
+             / (16.4955 + t*(38.82363 + t*(39.27121 + t*(21.69274 + t*(6.699398 + t))))))
+    else:
+        u = t*t
+        w = np.exp(u) - t * (36183.31 - u*(3321.9905 - u*(1540.787 - u*(219.0313 - u*(35.76683 - u*(1.320522 - u*0.56419)))))) \
+            / (32066.6 - u*(24322.84 - u*(9022.228 - u*(2186.181 - u*(364.2191 - u*(61.57037 - u*(1.841439 - u)))))))
+
+    return w.real * inv_sigma_sqrt2 / np.sqrt(np.pi)
+
+
+@numba.njit(parallel = True, fastmath = True, cache = True)
+def _voigt_sum(
+new_x,
+x,
+y,
+sigma,
+gamma,
+out
+):
+    """ Sum up the voigt profiles of all transitions (*x*, *y*) on the grid *new_x* and write the result to *out* """
+
+    for i in numba.prange(new_x.shape[0]):
+        acc = 0.0
+        for j in range(x.shape[0]):
+            acc += _voigt_humlicek(new_x[i] - x[j], sigma, gamma) * y[j]
+        out[i] = acc
 
 
 def broaden(
@@ -57,12 +127,17 @@ e_min,
 e_max,
 steps = 2000
 ):
-    """ Broaden an array of transitions with a voigt function """
+    """
+    Broaden an array of transitions with a voigt function.
+
+    The profiles are evaluated in float64 (the rational approximation loses precision in float32 for energies of several
+    keV), only the returned intensities are float32.
+    """
 
     new_x = np.linspace(e_min, e_max, steps)
-    new_y = np.zeros(new_x.shape)
-    for xs, ys in zip(x, y):
-        new_y += scipy.special.voigt_profile(new_x-xs, sigma, gamma) * ys
+    new_y = np.zeros(new_x.shape, dtype = np.float32)
+    _voigt_sum(new_x, np.ascontiguousarray(x, dtype = np.float64), np.ascontiguousarray(y, dtype = np.float64),
+               float(sigma), float(gamma), new_y)
     return new_x, new_y
 
 buffer_size = 1500 # Anticipate up to *buffer_size* MOs
@@ -70,76 +145,69 @@ atoms = ['Co', 'O', 'N', 'C', 'H']
 orbitals = ['s', 'px', 'py', 'pz', 'dxz', 'dxy', 'dyz', 'dz2', 'dx2y2']
 orbitals_simple = ['s', 'p', 'd']
 states = ['a', 'b']
-mos = np.zeros((buffer_size, len(states), len(atoms), len(orbitals)))
+mos = np.zeros((buffer_size, len(states), len(atoms), len(orbitals)), dtype = np.float32)
 
-pattern = r'^\s*\d+\s([CNOHo]{1,2})\s+([spdxyz2]{1,5})\s+(\d+\.\d)\s*(\d+\.\d)?\s*(\d+\.\d)?\s*(\d+\.\d)?\s*(\d+\.\d)?\s*(\d+\.\d)?$|^\s{12,}(\d{1,4}\s)(\s+\d{1,4})?(\s+\d{1,4})?(\s+\d{1,4})?(\s+\d{1,4})?(\s+\d{1,4})?\s*$'
+# Data rows (atom, orbital, up to six contributions), header rows (up to six orbital numbers) and spin headers.
+# The file is scanned as a whole, so whitespace classes must not run across line breaks.
+ROW_RE = re.compile(rb'^[ \t]*\d+[ \t]([CNOHo]{1,2})[ \t]+([spdxyz2]{1,5})[ \t]+((?:\d+\.\d[ \t]*){1,6})$', re.M)
+HEADER_RE = re.compile(rb'^[ \t]{12,}(\d{1,4}(?:[ \t]+\d{1,4}){0,5})[ \t]*$', re.M)
+SPIN_RE = re.compile(rb'SPIN (UP|DOWN)')
 
 ####################################################################################################
 #                   Populate MO array
 ####################################################################################################
 
-# Populate the *mos* array
-with open(file_mos, 'r') as f:
-    for l in f.readlines():
-
-        if "SPIN UP" in l:
-            state = 0
-        elif "SPIN DOWN" in l:
-            state = 1
-
-        m = re.match(pattern, l)
-
-        if m:
-
-            try:
-
-                no = [int(g) for g in m.groups()[8:] if g != None]
-
-                if len(no) == 0:
-                    raise Exception("No orbital numbers found")
-
-                orbno = no
-                continue
+# Scan the memory-mapped file once per pattern and keep the match offsets, so that every data row can be assigned to
+# the preceding header and spin block afterwards
+with open(file_mos, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+    spins = [(m.start(), int(m.group(1) == b'DOWN')) for m in SPIN_RE.finditer(mm)]
+    headers = [(m.start(), [int(g) for g in m.group(1).split()]) for m in HEADER_RE.finditer(mm)]
+    rows = [(m.start(), m.group(1).decode(), m.group(2).decode(), m.group(3).split()) for m in ROW_RE.finditer(mm)]
 
-            except Exception as e:
-                pass
+row_pos = np.array([r[0] for r in rows], dtype = np.int64)
+row_header = np.searchsorted(np.array([h[0] for h in headers], dtype = np.int64), row_pos) - 1
+row_spin = np.searchsorted(np.array([sp[0] for sp in spins], dtype = np.int64), row_pos) - 1
 
-            atom, orb, *contr = m.groups()[:8]
-            contr = [float(v) for v in contr if v != None]
+# Populate the *mos* array
+mo_idx, contr = [], []
+for (_, atom, orb, values), h, sp in zip(rows, row_header, row_spin):
+    if h < 0:
+        continue
+    state = spins[sp][1] if sp >= 0 else 0
+    atom_idx, orb_idx = atoms.index(atom), orbitals.index(orb)
+    for c, orb_number in zip(values, headers[h][1]):
+        mo_idx.append((orb_number-1, state, atom_idx, orb_idx))
+        contr.append(float(c))
 
-            for c, orb_number in zip(contr, orbno):
-                mos[orb_number-1, state, atoms.index(atom), orbitals.index(orb)] += c
+np.add.at(mos, tuple(np.array(mo_idx, dtype = np.int64).reshape(-1, 4).T), contr)
 
 
 # Group orbitals by shell (e.g. px, py, pz -> p)
-mos = np.array([mos[:, :, :, s].sum(axis = 3) for s in [slice(0,1), slice(1,4), slice(4,9)] ])
-mos = np.moveaxis(mos, 0, -1)
+mos = np.add.reduceat(mos, [0, 1, 4], axis = 3)
 
-pattern = r'^\s+(\d+)\s+(\d+)([a,b]{1})(?=\s->\s{4}0)\s->\s+\d+[a,b]{1}\s+(\d+\.\d+)\s+(\d+\.\d+).*\d+\.\d+.*\d+\.\d+.*\d+\.\d+$'
+TR_RE = re.compile(rb'^[ \t]+(\d+)[ \t]+(\d+)([ab])(?=[ \t]->[ \t]{4}0)[ \t]->[ \t]+\d+[ab][ \t]+(\d+\.\d+)[ \t]+(\d+\.\d+).*\d+\.\d+.*\d+\.\d+.*\d+\.\d+$', re.M)
 
 
 ####################################################################################################
 #                   Populate transition array
 ####################################################################################################
 
-buffer_size = 2000 # Anticipate up to *buffer_size* transitions
-transitions = np.zeros((buffer_size, mos.shape[2], mos.shape[3]))
-energies = np.zeros(buffer_size)
+# TR_RE is a bytes pattern, so the file has to be handed over in binary mode
+with open(file_transitions, 'rb') as f:
+    tr = np.fromregex(f, TR_RE,
+                      dtype = [('no', np.int64), ('orb', np.int64), ('state', 'S1'), ('energy', np.float64), ('intensity', np.float64)])
+
+if tr.size == 0:
+    sys.exit('No transitions found in {}'.format(file_transitions))
 
-with open(file_transitions, 'r') as f:
-    for l in f.readlines():
-        m = re.match(pattern, l)
-        if m:
-            transition_no, orb, state, energy, intensity = m.groups()
-            if state == 'a':
-                state = 0
-            elif state == 'b':
-                state = 1
+# All transitions are known at this point, so the arrays can be sized exactly
+n_transitions = tr['no'].max()
+transitions = np.zeros((n_transitions, mos.shape[2], mos.shape[3]), dtype = np.float32)
+energies = np.zeros(n_transitions)  # keV-scale positions need float64
 
-            total_int = float(intensity)
-            energies[int(transition_no)-1] = float(energy)
-            intensites = [[orbital*total_int for orbital in atom] for atom in mos[int(orb), state]]
-            transitions[int(transition_no)-1] = intensites
+tno = tr['no'] - 1
+energies[tno] = tr['energy']
+transitions[tno] = mos[tr['orb'], (tr['state'] == b'b').astype(int)] * tr['intensity'].astype(np.float32)[:, None, None]
 
 
 energies, transitions = filter_spectra(energies, transitions)
@@ -153,28 +221,17 @@ fig, axs = plt.subplots()
 plt.xlim([7632, 7665])
 axs.plot(bx_plot, by_plot/115, 'k')
 
-y_offset = np.zeros(energies.shape)
-
 colorlist = ['orangered', 'black', 'mediumblue', 'grey', 'springgreen']
-colorcounter = 0
-
-for atom in ['Co', 'O', 'N', 'C']:
-    for orbital in orbitals_simple:
-        if atom == 'Co' and orbital == 's':
-            continue
-        elif atom == 'Co' and orbital == 'p':
-            continue
-        elif atom == 'O' and orbital == 'd':
-            continue
-        elif atom == 'N':
-            continue
-        elif atom == 'C' and orbital == 'd':
-            continue
-        else: 
-            axs.bar(energies, transitions[:, atoms.index(atom), orbitals_simple.index(orbital)],
-                    bottom=y_offset, alpha = 1, label = '{}_{}'.format(atom, orbital), color = colorlist[colorcounter])
-            y_offset += transitions[:, atoms.index(atom), orbitals_simple.index(orbital)]
-            colorcounter += 1
+
+skip = {('Co', 's'), ('Co', 'p'), ('O', 'd'), ('C', 'd')} | {('N', orbital) for orbital in orbitals_simple}
+channels = [(atom, orbital) for atom in ['Co', 'O', 'N', 'C'] for orbital in orbitals_simple if (atom, orbital) not in skip]
+
+data = np.stack([transitions[:, atoms.index(atom), orbitals_simple.index(orbital)] for atom, orbital in channels])
+bottoms = np.vstack([np.zeros(len(energies)), data.cumsum(axis = 0)[:-1]])
+
+for i, (atom, orbital) in enumerate(channels):
+    axs.bar(energies, data[i], bottom = bottoms[i], alpha = 1, label = '{}_{}'.format(atom, orbital), color = colorlist[i])
+
 axs.set_ylim([0, 0.4])
 axs.legend(loc='upper left')
 fig.tight_layout()
@@ -1,6 +1,5 @@
 import os
 import sys
-import inspect
 from plantuml import PlantUML
 
 base_path = '/Users/esmaboydas/Desktop/NOMAD/dev/nomad-simulations/src'
@@ -27,9 +26,11 @@ def extract_classes_and_details(package_path, new_classes):
         for file in files:
             if file.endswith('.py'):
                 file_path = os.path.join(root, file)
-                # Compute the correct module name
-                relative_path = os.path.relpath(file_path, base_path)
-                module_name = relative_path.replace(os.sep, ".").rstrip(".py")
+                # Compute the correct module name; a package's __init__.py is the package module itself
+                relative_path = os.path.splitext(os.path.relpath(file_path, base_path))[0]
+                module_name = relative_path.replace(os.sep, ".")
+                if module_name.endswith('.__init__'):
+                    module_name = module_name[:-len('.__init__')]
                 print(f"Processing module: {module_name}")  # Debugging
 
                 try:
@@ -38,21 +39,30 @@ def extract_classes_and_details(package_path, new_classes):
                     print(f"Error importing {module_name}: {e}")
                     continue
 
-                for name, obj in inspect.getmembers(spec, inspect.isclass):
-                    # Only process classes that are in the new_classes list
-                    if name in new_classes:
+                for name, obj in vars(spec).items():
+                    # Only process classes defined in this module that are in the new_classes list;
+                    # re-exports from other modules are skipped by the __module__ check
+                    if not isinstance(obj, type) or name not in new_classes:
+                        continue
+                    if obj.__module__ == spec.__name__:
                         print(f"Found class: {name}")  # Debugging
-                        if inspect.getmodule(obj).__file__ == file_path:
-                            parent_classes = [cls.__name__ for cls in obj.__bases__ if cls.__name__ != 'object']
-                            quantities = [
-                                member_name for member_name, member in inspect.getmembers(obj)
-                                if "Quantity" in str(type(member))
-                            ]
-                            subsections = [
-                                member_name for member_name, member in inspect.getmembers(obj)
-                                if "SubSection" in str(type(member))
-                            ]
-                            classes_with_details.append((name, parent_classes, quantities, subsections))
+                        parent_classes = [cls.__name__ for cls in obj.__bases__ if cls.__name__ != 'object']
+                        # Merge the class dicts along the MRO (the first definition of a name wins), so
+                        # inherited members are listed as with inspect.getmembers, also from bases outside
+                        # new_classes that never get a box of their own
+                        members = {}
+                        for base in obj.__mro__:
+                            for member_name, member in vars(base).items():
+                                members.setdefault(member_name, member)
+                        quantities = []
+                        subsections = []
+                        for member_name, member in sorted(members.items()):
+                            type_name = type(member).__name__
+                            if type_name == 'Quantity':
+                                quantities.append(member_name)
+                            elif type_name == 'SubSection':
+                                subsections.append(member_name)
+                        classes_with_details.append((name, parent_classes, quantities, subsections))
 
     return classes_with_details
 
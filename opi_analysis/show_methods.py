@@ -7,6 +7,8 @@ Features
 • List every Block* definition it finds.
 • Print the attribute names of an individual block.
 • Verbose mode (-v) adds type & one-line description.
+• The parsed schema is cached next to the JSON (<schema>.json.pkl) and
+  reused while it is newer than the JSON file.
 
 Usage examples
 --------------
@@ -22,19 +24,38 @@ python show_block_attrs.py opi_vocab_schema.json BlockMp2 -v
 """
 
 import argparse
-import json
+import pickle
 import sys
 from pathlib import Path
 from textwrap import indent
 
+import orjson
+
 
 # ──────────────────────────────────────────────────────────────────────────
 def load_schema(path: Path) -> dict:
+    """Parse the schema, reusing a pickled sidecar cache if it is up to date."""
+    # Unpickling runs arbitrary code: only use this cache in directories you
+    # trust, as anyone who can write <schema>.json.pkl controls this script.
+    cache = path.with_suffix(".json.pkl")
+    try:
+        # A cache that is not strictly newer than the JSON is stale and rebuilt
+        if cache.stat().st_mtime > path.stat().st_mtime:
+            return pickle.loads(cache.read_bytes())
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass  # missing / unreadable cache -> fall back to parsing the JSON
+
     try:
-        return json.loads(path.read_text())
+        schema = orjson.loads(path.read_bytes())
     except Exception as exc:
         sys.exit(f"❌  Failed to read or parse JSON: {exc}")
 
+    try:
+        cache.write_bytes(pickle.dumps(schema, protocol=5))
+    except OSError:
+        pass  # read-only location: just skip caching
+    return schema
+
 
 def list_blocks(schema: dict) -> list[str]:
     """Return all keys in $defs that start with 'Block'."""
@@ -78,18 +99,17 @@ def main() -> None:
     ns = ap.parse_args()
 
     schema = load_schema(ns.schema)
-    blocks = list_blocks(schema)
 
     # ---- ‘list’ mode or no section supplied --------------------------------
     if ns.list or ns.section is None:
-        print_block_table(blocks)
+        print_block_table(list_blocks(schema))
         if ns.list:
             return
         # no section? -> done
         sys.exit(0)
 
     # ---- show the chosen block ---------------------------------------------
-    if ns.section not in blocks:
+    if not ns.section.startswith("Block") or ns.section not in schema.get("$defs", {}):
         sys.exit(f'❌  "{ns.section}" is not a recognised Block*. Use --list to view all.')
 
     props = pick_section(schema, ns.section).get("properties", {})
@@ -15,11 +15,22 @@ Run:
 
 import csv
 import json
-import random
-from dataclasses import dataclass, asdict
-from typing import Dict, List, Optional, Sequence, Set
-
+import operator
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ----------------------------------------------------------------------
 # Configuration
@@ -34,17 +45,45 @@ OWNER = "visible"
 PROGRAM_NAME = "ORCA"
 
 PAGE_SIZE = 1000             # entries per page
+SYSTEM_AGG_SIZE = 1000       # max. system buckets requested from the server
 TARGET_SIZES = [500, 2000]   # sample sizes you want
 RNG_SEED = 123456            # for reproducible sampling
 
+# The fetched population is cached on disk (Parquet) per (OWNER, PROGRAM_NAME)
+# and reused by reruns while it is younger than CACHE_TTL_SECONDS.
+CACHE_TTL_SECONDS = 86400
+CACHE_FILE = f"nomad_cache_{OWNER}_{PROGRAM_NAME or 'all'}.parquet"
+
+
+# ----------------------------------------------------------------------
+# HTTP session: keep-alive connection pool shared by all page requests
+# ----------------------------------------------------------------------
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
+_SESSION.headers.update(
+    {"Accept": "application/json", "User-Agent": "nomad-curator/1.0"}
+)
+
 
 # ----------------------------------------------------------------------
 # Data model
 # ----------------------------------------------------------------------
-@dataclass
+@dataclass(eq=False)
 class RepoEntry:
     """
-    Minimal representation of an entry for sampling.
+    Minimal representation of an entry, as written to the sample manifests.
     """
     entry_id: str
     upload_id: Optional[str]
@@ -53,12 +92,51 @@ class RepoEntry:
     system: str                     # classification used for stratification
     structural_type: Optional[str]
 
-    @classmethod
-    def from_api_result(cls, d: dict) -> "RepoEntry":
+
+def normalize_main_author(raw_ma: object) -> Optional[str]:
+    """
+    Normalize the main_author of a hit (string or object) to a string.
+    """
+    if isinstance(raw_ma, str):
+        return raw_ma.strip() or None
+    if isinstance(raw_ma, dict):
+        # Heuristic: prefer name, then email, then repr
+        name = raw_ma.get("name")
+        email = raw_ma.get("email")
+        if isinstance(name, str) and name.strip():
+            return name.strip()
+        if isinstance(email, str) and email.strip():
+            return email.strip()
+        # Fallback: some stable string representation
+        return json.dumps(raw_ma, sort_keys=True)
+    return None
+
+
+@dataclass
+class EntryTable:
+    """
+    Column-wise (struct-of-arrays) store of all fetched entries.
+
+    Sampling only touches `systems` and `main_authors` and works on integer
+    row positions; RepoEntry objects are built for the sampled rows only.
+    """
+    entry_ids: List[str] = field(default_factory=list)
+    upload_ids: List[Optional[str]] = field(default_factory=list)
+    mainfiles: List[Optional[str]] = field(default_factory=list)
+    main_authors: List[Optional[str]] = field(default_factory=list)
+    systems: List[str] = field(default_factory=list)
+    structural_types: List[Optional[str]] = field(default_factory=list)
+    # one shared str object per distinct main_author (see extend_from_hits)
+    _author_pool: Dict[str, str] = field(default_factory=dict, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.entry_ids)
+
+    def extend_from_hits(self, hits: List[dict]) -> None:
         """
-        Build RepoEntry from a single hit of /entries/query.
+        Append all hits of one /entries/query page.
 
-        Expected structure (since we use required.include):
+        Expected structure per hit (since we use required.include):
 
             {
               "entry_id": "...",
@@ -72,67 +150,152 @@ class RepoEntry:
               }
             }
 
-        We try to normalize main_author to a string.
+        Equal system / main_author strings are interned, so every distinct
+        value is stored once and set/dict lookups can short-circuit on identity.
+        """
+        # bind the appends once, the loop runs for every hit
+        add_entry_id = self.entry_ids.append
+        add_upload_id = self.upload_ids.append
+        add_mainfile = self.mainfiles.append
+        add_main_author = self.main_authors.append
+        add_system = self.systems.append
+        add_structural_type = self.structural_types.append
+        intern_author = self._author_pool.setdefault
+
+        for d in hits:
+            entry_id = d.get("entry_id")
+            if entry_id is None:
+                # Skip malformed hits (should be rare)
+                continue
+
+            results = d.get("results") or {}
+            material = results.get("material") or {}
+            structural_type = material.get("structural_type")
+            if structural_type:
+                structural_type = sys.intern(structural_type)
+
+            main_author = normalize_main_author(d.get("main_author"))
+            if main_author is not None:
+                main_author = intern_author(main_author, main_author)
+
+            add_entry_id(entry_id)
+            add_upload_id(d.get("upload_id"))
+            add_mainfile(d.get("mainfile"))
+            add_main_author(main_author)
+            # use structural_type as our "system" label; fall back to "unknown"
+            add_system(structural_type if structural_type else "unknown")
+            add_structural_type(structural_type)
+
+    def extend_from_columns(self, columns: Dict[str, list]) -> None:
+        """
+        Append whole columns (as written by save_cached_table), interning
+        system / main_author strings the same way as extend_from_hits.
         """
-        entry_id = d["entry_id"]
-
-        upload_id = d.get("upload_id")
-        mainfile = d.get("mainfile")
-
-        raw_ma = d.get("main_author")
-        main_author: Optional[str]
-        if isinstance(raw_ma, str):
-            main_author = raw_ma.strip() or None
-        elif isinstance(raw_ma, dict):
-            # Heuristic: prefer name, then email, then repr
-            name = raw_ma.get("name")
-            email = raw_ma.get("email")
-            if isinstance(name, str) and name.strip():
-                main_author = name.strip()
-            elif isinstance(email, str) and email.strip():
-                main_author = email.strip()
-            else:
-                # Fallback: some stable string representation
-                main_author = json.dumps(raw_ma, sort_keys=True)
-        else:
-            main_author = None
-
-        results = d.get("results") or {}
-        material = results.get("material") or {}
-        structural_type = material.get("structural_type")
-
-        # use structural_type as our "system" label; fall back to "unknown"
-        system = structural_type if structural_type else "unknown"
-
-        return cls(
-            entry_id=entry_id,
-            upload_id=upload_id,
-            mainfile=mainfile,
-            main_author=main_author,
-            system=system,
-            structural_type=structural_type,
+        intern_author = self._author_pool.setdefault
+
+        self.entry_ids.extend(columns["entry_ids"])
+        self.upload_ids.extend(columns["upload_ids"])
+        self.mainfiles.extend(columns["mainfiles"])
+        self.main_authors.extend(
+            intern_author(a, a) if a is not None else None
+            for a in columns["main_authors"]
+        )
+        self.systems.extend(map(sys.intern, columns["systems"]))
+        self.structural_types.extend(
+            sys.intern(t) if t else t for t in columns["structural_types"]
+        )
+
+    def entry(self, i: int) -> RepoEntry:
+        """
+        Materialize row `i` as a RepoEntry.
+        """
+        return RepoEntry(
+            entry_id=self.entry_ids[i],
+            upload_id=self.upload_ids[i],
+            mainfile=self.mainfiles[i],
+            main_author=self.main_authors[i],
+            system=self.systems[i],
+            structural_type=self.structural_types[i],
         )
 
 
 # ----------------------------------------------------------------------
 # API: fetch full ORCA population via /entries/query
 # ----------------------------------------------------------------------
-def fetch_all_entries() -> List[RepoEntry]:
+def build_query() -> Dict[str, object]:
+    """
+    Entry filter shared by all /entries/query requests.
+    """
+    query: Dict[str, object] = {}
+    if PROGRAM_NAME is not None:
+        query["results.method.simulation.program_name"] = PROGRAM_NAME
+    return query
+
+
+def fetch_system_distribution() -> Optional[Dict[str, int]]:
+    """
+    Ask NOMAD for the per-system entry counts via a terms aggregation.
+
+    The counts come from the server-side search index in a single request
+    (no hits are transferred), so they are available before pagination starts.
+    Entries without structural_type are not bucketed by the server; they are
+    reported as "unknown" (total minus bucketed). Returns None if the API
+    rejects the aggregation or the buckets may be truncated, in which case
+    the caller counts client-side.
+    """
+    json_body = {
+        "owner": OWNER,
+        "query": build_query(),
+        "pagination": {"page_size": 0},
+        "aggregations": {
+            "systems": {
+                "terms": {
+                    "quantity": "results.material.structural_type",
+                    "size": SYSTEM_AGG_SIZE,
+                }
+            }
+        },
+    }
+    try:
+        resp = _SESSION.post(
+            f"{NOMAD_API_URL}/entries/query", json=json_body, timeout=(5, 60)
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        terms = data["aggregations"]["systems"]["terms"]
+        buckets = terms["data"]
+        total = data["pagination"]["total"]
+        dist = {b["value"]: b["count"] for b in buckets}
+    except (requests.RequestException, ValueError, KeyError, TypeError) as exc:
+        print(f"[warn] Aggregation request failed ({exc}), counting client-side.")
+        return None
+
+    # Systems beyond the last bucket would be lumped into "unknown" below
+    if len(buckets) >= SYSTEM_AGG_SIZE or terms.get("sum_other_doc_count", 0) > 0:
+        print("[warn] Aggregation truncated, counting client-side.")
+        return None
+
+    n_unknown = total - sum(dist.values())
+    if n_unknown > 0:
+        dist["unknown"] = dist.get("unknown", 0) + n_unknown
+    return dist
+
+
+def fetch_all_entries() -> EntryTable:
     """
     Fetch entries using the v1 /entries/query API.
 
     Uses value-based pagination via `next_page_after_value`.
     If PROGRAM_NAME is set, filters by results.method.simulation.program_name.
+
+    One request is kept in flight: page K+1 is requested as soon as page K's
+    `next_page_after_value` is known, i.e. while page K is still being parsed.
     """
     print("[info] Fetching population from NOMAD (v1 /entries/query)...")
 
-    query: Dict[str, object] = {}
-    if PROGRAM_NAME is not None:
-        query["results.method.simulation.program_name"] = PROGRAM_NAME
-
     json_body = {
         "owner": OWNER,
-        "query": query,
+        "query": build_query(),
         "pagination": {
             "page_size": PAGE_SIZE,
             "order_by": "entry_id",
@@ -150,74 +313,130 @@ def fetch_all_entries() -> List[RepoEntry]:
         },
     }
 
-    all_entries: List[RepoEntry] = []
+    url = f"{NOMAD_API_URL}/entries/query"
+    table = EntryTable()
     page = 0
 
-    while True:
-        resp = requests.post(f"{NOMAD_API_URL}/entries/query", json=json_body)
-        try:
-            resp.raise_for_status()
-        except requests.HTTPError:
-            print("[error] status:", resp.status_code)
-            print("[error] body:", resp.text[:2000])
-            raise
-
-        data = resp.json()
-        hits = data.get("data", [])
-        if not hits:
-            break
+    def post(body: dict) -> requests.Response:
+        return _SESSION.post(url, json=body, timeout=(5, 60))
 
-        for d in hits:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future = executor.submit(post, json_body)
+        while future is not None:
+            resp = future.result()
+            future = None
             try:
-                entry = RepoEntry.from_api_result(d)
-                all_entries.append(entry)
-            except KeyError:
-                # Skip malformed hits (should be rare)
-                continue
+                resp.raise_for_status()
+            except requests.HTTPError:
+                print("[error] status:", resp.status_code)
+                print("[error] body:", resp.text[:2000])
+                raise
+
+            data = resp.json()
+            hits = data.get("data", [])
+            if not hits:
+                break
 
-        page += 1
-        print(
-            f"[page] {page}: fetched {len(hits)} entries, "
-            f"total so far {len(all_entries)}"
-        )
+            # Prefetch: request the next page (continuing after this entry_id)
+            # before parsing the current one, so network wait and parsing overlap
+            pagination = data.get("pagination") or {}
+            next_val = pagination.get("next_page_after_value")
+            if next_val:
+                next_body = {
+                    **json_body,
+                    "pagination": {**json_body["pagination"], "page_after_value": next_val},
+                }
+                future = executor.submit(post, next_body)
 
-        pagination = data.get("pagination") or {}
-        next_val = pagination.get("next_page_after_value")
-        if not next_val:
-            # no further pages
-            break
+            table.extend_from_hits(hits)
 
-        # Continue after this entry_id in subsequent request
-        json_body["pagination"]["page_after_value"] = next_val
+            page += 1
+            print(
+                f"[page] {page}: fetched {len(hits)} entries, "
+                f"total so far {len(table)}"
+            )
 
-    print(f"[info] Done. Total entries fetched: {len(all_entries)}")
-    return all_entries
+    print(f"[info] Done. Total entries fetched: {len(table)}")
+    return table
+
+
+# ----------------------------------------------------------------------
+# On-disk population cache
+# ----------------------------------------------------------------------
+CACHE_COLUMNS = [
+    "entry_ids",
+    "upload_ids",
+    "mainfiles",
+    "main_authors",
+    "systems",
+    "structural_types",
+]
+
+
+def save_cached_table(table: EntryTable, path: str) -> None:
+    columns = {name: getattr(table, name) for name in CACHE_COLUMNS}
+    pq.write_table(
+        pa.table(columns), path, compression="zstd", compression_level=3
+    )
+    print(f"[info] Cached population: {path}")
+
+
+def load_cached_table(path: str) -> Optional[EntryTable]:
+    """
+    Return the cached population if `path` exists and is younger than
+    CACHE_TTL_SECONDS, else None (also if the cache cannot be read).
+    """
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+    if age > CACHE_TTL_SECONDS:
+        return None
+
+    try:
+        columns = pq.read_table(path, columns=CACHE_COLUMNS).to_pydict()
+    except (OSError, pa.ArrowException, KeyError) as exc:
+        print(f"[warn] Ignoring unreadable cache {path}: {exc}")
+        return None
+
+    print(f"[info] Using cached population: {path} ({age / 3600:.1f} h old)")
+    table = EntryTable()
+    table.extend_from_columns(columns)
+    return table
 
 
 # ----------------------------------------------------------------------
 # main_author-diverse stratified sampling
 # ----------------------------------------------------------------------
 def main_author_diverse_stratified_sample(
-    entries: Sequence[RepoEntry],
+    table: EntryTable,
     target_size: int,
-    rng: random.Random,
-) -> List[RepoEntry]:
+    np_rng: np.random.Generator,
+) -> List[int]:
     """
-    Stratified random sample over RepoEntry.system, *favoring* main_author diversity.
+    Stratified random sample over `system`, *favoring* main_author diversity.
+    Returns the row positions of the selected entries in `table`.
+
+    All random draws come from `np_rng` (seeded from RNG_SEED for
+    reproducibility).
 
     Steps:
     - Bucket entries by `system`.
     - Compute per-system allocation approximately proportional to bucket size.
-    - For each system:
-        - Shuffle bucket.
-        - First pass: pick entries whose main_author is NOT yet used globally.
-        - Second pass (if still needed): fill up to allocation ignoring main_author overlap.
+    - Order all entries once: rarest main_author first, ties in random order.
+    - First pass over that order: pick entries whose system still has quota
+      and whose main_author is NOT yet used.
+    - Second pass (if still needed): fill the remaining quotas ignoring
+      main_author overlap, in a fresh uniformly random order (so the filler
+      is not biased towards rare authors).
     - Trim / top up globally to match `target_size` exactly.
     """
     if target_size <= 0:
         raise ValueError("target_size must be positive")
 
-    n_total = len(entries)
+    n_total = len(table)
+    systems = table.systems
+    authors = table.main_authors
     if n_total == 0:
         raise ValueError("no entries available for sampling")
 
@@ -228,93 +447,86 @@ def main_author_diverse_stratified_sample(
         )
         target_size = n_total
 
-    # Bucket entries by system label
-    buckets: Dict[str, List[RepoEntry]] = {}
-    for e in entries:
-        buckets.setdefault(e.system, []).append(e)
-
-    # --- compute proportional allocation per system ---
-    alloc: Dict[str, int] = {}
-    for system, bucket in buckets.items():
-        frac = len(bucket) / n_total
-        k = int(round(frac * target_size))
-        if k < 1 and len(bucket) > 0:
-            k = 1
-        alloc[system] = k
-
-    # Adjust allocation to match target_size exactly
-    current = sum(alloc.values())
-    systems_sorted = sorted(
-        buckets.keys(),
-        key=lambda s: len(buckets[s]),
-        reverse=True,
+    # Bucket label per row position (one bucket per unique system label)
+    _, inverse, counts = np.unique(
+        np.asarray(systems), return_inverse=True, return_counts=True
     )
 
-    if current < target_size:
-        # Distribute remaining samples to largest buckets
-        remaining = target_size - current
-        idx = 0
-        while remaining > 0:
-            s = systems_sorted[idx % len(systems_sorted)]
-            alloc[s] += 1
-            remaining -= 1
-            idx += 1
-    elif current > target_size:
+    # --- compute proportional allocation per system (at least 1 per bucket) ---
+    alloc = np.maximum(np.round(counts * target_size / n_total).astype(np.int64), 1)
+
+    # Adjust allocation to match target_size exactly, largest buckets first
+    systems_sorted = np.argsort(-counts, kind="stable")
+    diff = target_size - int(alloc.sum())
+
+    if diff > 0:
+        # Distribute remaining samples round-robin over the largest buckets
+        alloc[systems_sorted] += diff // len(systems_sorted)
+        alloc[systems_sorted[: diff % len(systems_sorted)]] += 1
+    while diff < 0:
         # Remove surplus from largest buckets, but keep at least 1 per non-empty bucket
-        surplus = current - target_size
-        idx = 0
-        while surplus > 0 and any(v > 1 for v in alloc.values()):
-            s = systems_sorted[idx % len(systems_sorted)]
-            if alloc[s] > 1:
-                alloc[s] -= 1
-                surplus -= 1
-            idx += 1
+        reducible = systems_sorted[alloc[systems_sorted] > 1][:-diff]
+        if reducible.size == 0:
+            break
+        alloc[reducible] -= 1
+        diff += reducible.size
 
     # --- main_author-diverse selection ---
+    # One global candidate order: entries of rare authors come first, so a
+    # prolific author does not use up the quota other authors could fill.
+    author_counts = Counter(authors)
+    rarity = np.fromiter(
+        (author_counts[a] for a in authors), dtype=np.int64, count=n_total
+    )
+    order = np_rng.permutation(n_total)
+    order = order[np.argsort(rarity[order], kind="stable")].tolist()
+
+    bucket_of = inverse.tolist()
+    quota = alloc.tolist()
+    open_slots = sum(quota)
+    taken = [False] * n_total
     used_authors: Set[str] = set()
-    selected: List[RepoEntry] = []
+    selected: List[int] = []
 
-    for system in systems_sorted:
-        bucket = buckets[system]
-        need = alloc.get(system, 0)
-        if need <= 0 or not bucket:
+    # First pass: prefer unseen main_author
+    for i in order:
+        if not open_slots:
+            break
+        s = bucket_of[i]
+        if not quota[s]:
             continue
-
-        bucket_copy = bucket[:]
-        rng.shuffle(bucket_copy)
-
-        system_selected: List[RepoEntry] = []
-
-        # First pass: prefer unseen main_author
-        for e in bucket_copy:
-            if len(system_selected) >= need:
+        author = authors[i]
+        if author is None or author in used_authors:
+            continue
+        used_authors.add(author)
+        quota[s] -= 1
+        open_slots -= 1
+        taken[i] = True
+        selected.append(i)
+
+    # Second pass: fill remaining slots ignoring author overlap
+    if open_slots:
+        for i in np_rng.permutation(n_total).tolist():
+            if not open_slots:
                 break
-            if e.main_author is None:
-                continue
-            if e.main_author not in used_authors:
-                system_selected.append(e)
-                used_authors.add(e.main_author)
-
-        # Second pass: fill remaining slots ignoring author overlap
-        if len(system_selected) < need:
-            for e in bucket_copy:
-                if len(system_selected) >= need:
-                    break
-                if e in system_selected:
-                    continue
-                system_selected.append(e)
-
-        selected.extend(system_selected)
+            s = bucket_of[i]
+            if quota[s] and not taken[i]:
+                quota[s] -= 1
+                open_slots -= 1
+                selected.append(i)
 
     # --- global trim / top-up to exact target_size ---
     if len(selected) > target_size:
-        selected = rng.sample(selected, target_size)
+        keep = np_rng.choice(len(selected), size=target_size, replace=False)
+        selected = np.asarray(selected)[keep].tolist()
     elif len(selected) < target_size:
-        selected_ids = {e.entry_id for e in selected}
-        remaining_pool = [e for e in entries if e.entry_id not in selected_ids]
+        unselected = np.ones(n_total, dtype=bool)
+        unselected[selected] = False
+        remaining_pool = np.flatnonzero(unselected)
         k_extra = min(target_size - len(selected), len(remaining_pool))
         if k_extra > 0:
-            selected.extend(rng.sample(remaining_pool, k_extra))
+            extra = np_rng.choice(len(remaining_pool), size=k_extra, replace=False)
+            selected.extend(remaining_pool[extra].tolist())
 
     return selected
 
@@ -323,9 +535,10 @@ def main_author_diverse_stratified_sample(
 # Output helpers
 # ----------------------------------------------------------------------
 def write_json(filename: str, entries: List[RepoEntry]) -> None:
-    data = [asdict(e) for e in entries]
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    # orjson serializes the dataclasses natively, no asdict() copies needed
+    payload = orjson.dumps(entries, option=orjson.OPT_INDENT_2)
+    with open(filename, "wb") as f:
+        f.write(payload)
     print(f"[info] Wrote JSON sample: {filename}")
 
 
@@ -338,11 +551,11 @@ def write_csv(filename: str, entries: List[RepoEntry]) -> None:
         "system",
         "structural_type",
     ]
+    getter = operator.attrgetter(*fieldnames)
     with open(filename, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for e in entries:
-            writer.writerow(asdict(e))
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(getter(e) for e in entries)
     print(f"[info] Wrote CSV sample:  {filename}")
 
 
@@ -350,22 +563,32 @@ def write_csv(filename: str, entries: List[RepoEntry]) -> None:
 # Main
 # ----------------------------------------------------------------------
 def main() -> None:
-    rng = random.Random(RNG_SEED)
+    np_rng = np.random.default_rng(RNG_SEED)
+
+    table = load_cached_table(CACHE_FILE)
+    global_system_dist: Optional[Dict[str, int]] = None
+
+    if table is None:
+        # Global system stats, straight from the server index if possible
+        global_system_dist = fetch_system_distribution()
+        if global_system_dist is not None:
+            print(f"[info] Global system distribution: {global_system_dist}")
 
-    all_entries = fetch_all_entries()
-    if not all_entries:
-        print("[error] No entries fetched, aborting.")
-        return
+        table = fetch_all_entries()
+        if not len(table):
+            print("[error] No entries fetched, aborting.")
+            return
+        save_cached_table(table, CACHE_FILE)
 
-    # Global system stats
-    global_system_dist: Dict[str, int] = {}
-    for e in all_entries:
-        global_system_dist[e.system] = global_system_dist.get(e.system, 0) + 1
-    print(f"[info] Global system distribution: {global_system_dist}")
+    if global_system_dist is None:
+        global_system_dist = {}
+        for system in table.systems:
+            global_system_dist[system] = global_system_dist.get(system, 0) + 1
+        print(f"[info] Global system distribution: {global_system_dist}")
 
     # Global main_author stats
     distinct_main_authors: Set[str] = set(
-        e.main_author for e in all_entries if e.main_author is not None
+        a for a in table.main_authors if a is not None
     )
     print(f"[info] Global distinct main_author's: {len(distinct_main_authors)}")
 
@@ -373,18 +596,19 @@ def main() -> None:
         if size <= 0:
             continue
 
-        if size > len(all_entries):
+        if size > len(table):
             print(
-                f"[warn] Requested {size} entries but only {len(all_entries)} "
-                f"are available. Using {len(all_entries)} instead."
+                f"[warn] Requested {size} entries but only {len(table)} "
+                f"are available. Using {len(table)} instead."
             )
-            size = len(all_entries)
+            size = len(table)
 
 
         print(
             f"[info] Creating main-author-diverse stratified sample of size {size}..."
         )
-        sample = main_author_diverse_stratified_sample(all_entries, size, rng)
+        positions = main_author_diverse_stratified_sample(table, size, np_rng)
+        sample = [table.entry(i) for i in positions]
 
         # Sample stats
         sample_system_dist: Dict[str, int] = {}
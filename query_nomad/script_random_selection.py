@@ -2,7 +2,8 @@
 """
 Curate stratified ORCA samples from the NOMAD Repository (v1 API).
 
-- Fetch all visible ORCA entries via /entries/query
+- Fetch all visible ORCA entries via /entries/query, streaming each page
+  to an Arrow IPC file so memory stays bounded by the page size
 - Stratify by a derived "system" label from results.material.structural_type
 - Draw stratified, reproducible samples of target sizes
 - Write JSON and CSV manifests for each sample size
@@ -12,12 +13,18 @@ Run:
 """
 
 import csv
-import json
-import random
+import itertools
+import operator
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict
-from typing import Dict, List, Sequence
+from typing import Dict, List
 
+import numpy as np
+import orjson
+import pyarrow as pa
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ----------------------------------------------------------------------
 # Configuration
@@ -33,6 +40,8 @@ PAGE_SIZE = 1000            # entries per page
 TARGET_SIZES = [500, 2000]  # sample sizes you want
 RNG_SEED = 123456           # for reproducible sampling
 
+POPULATION_FILE = "orca_population.arrow"  # on-disk copy of the fetched population
+
 
 # ----------------------------------------------------------------------
 # Data model
@@ -88,14 +97,44 @@ class RepoEntry:
         )
 
 
+# Column layout of the on-disk population (one row per RepoEntry)
+POPULATION_SCHEMA = pa.schema([
+    ("entry_id", pa.string()),
+    ("upload_id", pa.string()),
+    ("mainfile", pa.string()),
+    ("system", pa.string()),
+    ("structural_type", pa.string()),
+])
+
+
 # ----------------------------------------------------------------------
 # API: fetch full ORCA population via /entries/query
 # ----------------------------------------------------------------------
-def fetch_all_orca_entries() -> List[RepoEntry]:
+def make_session() -> requests.Session:
+    """
+    HTTP session with keep-alive connection pooling and retries, so that
+    consecutive pages reuse the same TCP/TLS connection to the NOMAD host.
+    """
+    retry = Retry(total=3, backoff_factor=0.5, allowed_methods=frozenset({"POST"}))
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry),
+    )
+    return session
+
+
+def fetch_all_orca_entries(path: str) -> int:
     """
     Fetch all ORCA entries using the v1 /entries/query API.
 
     Uses value-based pagination via `next_page_after_value`.
+    Every page is written to the Arrow IPC file `path` as one record batch,
+    so only a single page is held in memory. Returns the number of entries.
+
+    Pagination is sequential (each request needs the previous page's
+    `next_page_after_value`), so pages cannot be fetched in parallel; instead
+    the request for page N+1 is in flight while page N is being processed.
     """
     print("[info] Fetching full ORCA population from NOMAD (v1 /entries/query)...")
 
@@ -121,68 +160,94 @@ def fetch_all_orca_entries() -> List[RepoEntry]:
         },
     }
 
-    all_entries: List[RepoEntry] = []
+    url = f"{NOMAD_API_URL}/entries/query"
+    n_entries = 0
     page = 0
 
-    while True:
-        resp = requests.post(f"{NOMAD_API_URL}/entries/query", json=json_body)
-        try:
-            resp.raise_for_status()
-        except requests.HTTPError:
-            print("[error] status:", resp.status_code)
-            print("[error] body:", resp.text[:2000])
-            raise
-
-        data = resp.json()
-        hits = data.get("data", [])
-        if not hits:
-            break
-
-        for d in hits:
+    with make_session() as session, \
+            ThreadPoolExecutor(max_workers=1) as pool, \
+            pa.OSFile(path, "wb") as sink, \
+            pa.ipc.new_file(sink, POPULATION_SCHEMA) as writer:
+        future = pool.submit(session.post, url, json=json_body, timeout=(5, 60))
+        while True:
+            resp = future.result()
             try:
-                entry = RepoEntry.from_api_result(d)
-                all_entries.append(entry)
-            except KeyError:
-                # Skip malformed hits (should be rare)
-                continue
+                resp.raise_for_status()
+            except requests.HTTPError:
+                print("[error] status:", resp.status_code)
+                print("[error] body:", resp.text[:2000])
+                raise
+
+            data = orjson.loads(resp.content)
+            hits = data.get("data", [])
+            if not hits:
+                break
+
+            # Request the next page right away (continuing after this entry_id),
+            # so the round trip overlaps with processing the current page
+            pagination = data.get("pagination") or {}
+            next_val = pagination.get("next_page_after_value")
+            if next_val:
+                next_body = {
+                    **json_body,
+                    "pagination": {**json_body["pagination"], "page_after_value": next_val},
+                }
+                future = pool.submit(session.post, url, json=next_body, timeout=(5, 60))
+
+            page_entries: List[RepoEntry] = []
+            for d in hits:
+                try:
+                    page_entries.append(RepoEntry.from_api_result(d))
+                except KeyError:
+                    # Skip malformed hits (should be rare)
+                    continue
+
+            writer.write_batch(pa.RecordBatch.from_pylist(
+                [asdict(e) for e in page_entries], schema=POPULATION_SCHEMA
+            ))
+            n_entries += len(page_entries)
+
+            page += 1
+            print(
+                f"[page] {page}: fetched {len(hits)} entries, "
+                f"total so far {n_entries}"
+            )
 
-        page += 1
-        print(
-            f"[page] {page}: fetched {len(hits)} entries, "
-            f"total so far {len(all_entries)}"
-        )
+            if not next_val:
+                # no further pages
+                break
 
-        pagination = data.get("pagination") or {}
-        next_val = pagination.get("next_page_after_value")
-        if not next_val:
-            # no further pages
-            break
+    print(f"[info] Done. Total ORCA entries fetched: {n_entries}")
+    return n_entries
 
-        # Continue after this entry_id in subsequent request
-        json_body["pagination"]["page_after_value"] = next_val
 
-    print(f"[info] Done. Total ORCA entries fetched: {len(all_entries)}")
-    return all_entries
+def load_entries(table: pa.Table, positions: np.ndarray) -> List[RepoEntry]:
+    """
+    Materialize RepoEntry objects for the given row positions only.
+    """
+    rows = table.take(pa.array(positions, type=pa.int64())).to_pylist()
+    return [RepoEntry(**row) for row in rows]
 
 
 # ----------------------------------------------------------------------
 # Stratified sampling (over `system`)
 # ----------------------------------------------------------------------
 def stratified_sample(
-    entries: Sequence[RepoEntry],
+    systems: np.ndarray,
     target_size: int,
-    rng: random.Random,
-) -> List[RepoEntry]:
+    rng: np.random.Generator,
+) -> np.ndarray:
     """
-    Stratified random sample over RepoEntry.system.
+    Stratified random sample over the `system` column.
 
     Allocation is proportional to bucket size, with a minimum of 1
     per non-empty bucket; then adjusted to exactly target_size if possible.
+    Returns the row positions of the selected entries.
     """
     if target_size <= 0:
         raise ValueError("target_size must be positive")
 
-    n_total = len(entries)
+    n_total = len(systems)
     if n_total == 0:
         raise ValueError("no entries available for sampling")
 
@@ -193,65 +258,51 @@ def stratified_sample(
         )
         target_size = n_total
 
-    # Bucket entries by system label
-    buckets: Dict[str, List[RepoEntry]] = {}
-    for e in entries:
-        buckets.setdefault(e.system, []).append(e)
+    # Bucket entries by system label: group positions per label in C
+    _, inverse, counts = np.unique(systems, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind="stable")
+    splits = np.split(order, np.cumsum(counts)[:-1])
 
-    # Initial proportional allocation
-    alloc: Dict[str, int] = {}
-    for system, bucket in buckets.items():
-        frac = len(bucket) / n_total
-        k = int(round(frac * target_size))
-        if k < 1 and len(bucket) > 0:
-            k = 1
-        alloc[system] = k
+    # Initial proportional allocation (at least 1 per non-empty bucket)
+    alloc = np.maximum(np.round(counts / n_total * target_size).astype(np.int64), 1)
 
     # Adjust allocation to match target_size exactly
-    current = sum(alloc.values())
-    systems_sorted = sorted(
-        buckets.keys(),
-        key=lambda s: len(buckets[s]),
-        reverse=True,
-    )
+    current = int(alloc.sum())
+    systems_sorted = np.argsort(-counts, kind="stable")
 
     if current < target_size:
         # Distribute remaining samples to largest buckets
         remaining = target_size - current
-        idx = 0
-        while remaining > 0:
-            s = systems_sorted[idx % len(systems_sorted)]
+        for s in itertools.islice(itertools.cycle(systems_sorted), remaining):
             alloc[s] += 1
-            remaining -= 1
-            idx += 1
     elif current > target_size:
         # Remove surplus from largest buckets, but keep at least 1 per non-empty bucket
         surplus = current - target_size
-        idx = 0
-        while surplus > 0 and any(v > 1 for v in alloc.values()):
-            s = systems_sorted[idx % len(systems_sorted)]
+        for s in itertools.cycle(systems_sorted):
+            if surplus == 0 or not (alloc > 1).any():
+                break
             if alloc[s] > 1:
                 alloc[s] -= 1
                 surplus -= 1
-            idx += 1
 
-    # Now draw the samples
-    selected: List[RepoEntry] = []
-    for system, bucket in buckets.items():
-        k = min(alloc.get(system, 0), len(bucket))
-        if k <= 0:
-            continue
-        selected.extend(rng.sample(bucket, k))
+    # Now draw the samples (as row positions)
+    selected = np.concatenate([
+        rng.choice(split, size=min(alloc[i], len(split)), replace=False)
+        for i, split in enumerate(splits)
+    ])
 
     # Fix small mismatches by global trim / top-up
     if len(selected) > target_size:
-        selected = rng.sample(selected, target_size)
+        selected = rng.choice(selected, size=target_size, replace=False)
     elif len(selected) < target_size:
-        selected_ids = {e.entry_id for e in selected}
-        remaining_pool = [e for e in entries if e.entry_id not in selected_ids]
+        mask = np.ones(n_total, dtype=bool)
+        mask[selected] = False
+        remaining_pool = np.flatnonzero(mask)
         k_extra = min(target_size - len(selected), len(remaining_pool))
         if k_extra > 0:
-            selected.extend(rng.sample(remaining_pool, k_extra))
+            selected = np.concatenate(
+                [selected, rng.choice(remaining_pool, size=k_extra, replace=False)]
+            )
 
     return selected
 
@@ -260,9 +311,9 @@ def stratified_sample(
 # Output helpers
 # ----------------------------------------------------------------------
 def write_json(filename: str, entries: List[RepoEntry]) -> None:
-    data = [asdict(e) for e in entries]
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    payload = orjson.dumps([asdict(e) for e in entries], option=orjson.OPT_INDENT_2)
+    with open(filename, "wb") as f:
+        f.write(payload)
     print(f"[info] Wrote JSON sample: {filename}")
 
 
@@ -274,11 +325,11 @@ def write_csv(filename: str, entries: List[RepoEntry]) -> None:
         "system",
         "structural_type",
     ]
+    getter = operator.attrgetter(*fieldnames)
     with open(filename, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for e in entries:
-            writer.writerow(asdict(e))
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(getter(e) for e in entries)
     print(f"[info] Wrote CSV sample:  {filename}")
 
 
@@ -286,45 +337,50 @@ def write_csv(filename: str, entries: List[RepoEntry]) -> None:
 # Main
 # ----------------------------------------------------------------------
 def main() -> None:
-    rng = random.Random(RNG_SEED)
+    rng = np.random.default_rng(RNG_SEED)
 
-    all_entries = fetch_all_orca_entries()
-    if not all_entries:
+    n_entries = fetch_all_orca_entries(POPULATION_FILE)
+    if not n_entries:
         print("[error] No ORCA entries fetched, aborting.")
         return
 
-    # Quick global system distribution
-    global_dist: Dict[str, int] = {}
-    for e in all_entries:
-        global_dist[e.system] = global_dist.get(e.system, 0) + 1
-    print(f"[info] Global system distribution: {global_dist}")
+    # Memory-map the population; sampling only needs the system column.
+    # Everything that touches the table stays inside the with block.
+    with pa.memory_map(POPULATION_FILE) as source:
+        table = pa.ipc.open_file(source).read_all()
+        systems = table.column("system").to_numpy(zero_copy_only=False)
 
-    for size in TARGET_SIZES:
-        if size <= 0:
-            continue
+        # Quick global system distribution
+        labels, counts = np.unique(systems, return_counts=True)
+        global_dist: Dict[str, int] = dict(zip(labels.tolist(), counts.tolist()))
+        print(f"[info] Global system distribution: {global_dist}")
 
-        if size > len(all_entries):
-            print(
-                f"[warn] Requested {size} entries but only {len(all_entries)} "
-                f"are available. Using {len(all_entries)} instead."
-            )
-            size = len(all_entries)
+        for size in TARGET_SIZES:
+            if size <= 0:
+                continue
+
+            if size > n_entries:
+                print(
+                    f"[warn] Requested {size} entries but only {n_entries} "
+                    f"are available. Using {n_entries} instead."
+                )
+                size = n_entries
 
-        print(f"[info] Creating stratified sample of size {size}...")
-        sample = stratified_sample(all_entries, size, rng)
+            print(f"[info] Creating stratified sample of size {size}...")
+            sample = load_entries(table, stratified_sample(systems, size, rng))
 
-        # Print sample system distribution
-        sample_dist: Dict[str, int] = {}
-        for e in sample:
-            sample_dist[e.system] = sample_dist.get(e.system, 0) + 1
-        print(f"[info] Sample {size} system distribution: {sample_dist}")
+            # Print sample system distribution
+            sample_dist: Dict[str, int] = {}
+            for e in sample:
+                sample_dist[e.system] = sample_dist.get(e.system, 0) + 1
+            print(f"[info] Sample {size} system distribution: {sample_dist}")
 
-        json_name = f"orca_sample_{size}.json"
-        csv_name = f"orca_sample_{size}.csv"
+            json_name = f"orca_sample_{size}.json"
+            csv_name = f"orca_sample_{size}.csv"
 
-        write_json(json_name, sample)
-        write_csv(csv_name, sample)
-        print()
+            write_json(json_name, sample)
+            write_csv(csv_name, sample)
+            print()
 
     print("[done] Sampling finished.")
 
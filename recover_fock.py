@@ -2,71 +2,172 @@
 
 
 import argparse
-import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 import numpy as np
+import orjson
 import scipy as sp
 
+# Below this size the divide-and-conquer LAPACK drivers bring no benefit
+DC_MIN_SIZE = 64
+
+# Safety factor on the rounding error estimates used by --verify, and the
+# absolute tolerance that is never undercut (what float64 always achieved)
+VERIFY_SAFETY = 2
+VERIFY_MIN_ATOL = 1e-9
+
 
 def reconstruct_fock(S, C, energies):
     # See Szabo Ostlund p. 142 and p. 143
-    s, U = np.linalg.eigh(S)
-    Xinv = U @ np.diag(np.sqrt(s)) @ U.T
-
-    C_ = Xinv @ C
-    F_ = C_ @ np.diag(energies) @ C_.T
+    # Any factorization S = Xinv @ Xinv.T works, as F = S C e C^T S. The
+    # Cholesky factor is much cheaper than the symmetric square root.
+    try:
+        Xinv = sp.linalg.cholesky(S, lower=True)
+    except np.linalg.LinAlgError:
+        s, U = sp.linalg.eigh(
+            S, driver="evd" if len(S) >= DC_MIN_SIZE else None
+        )
+        # Scaling the columns is the same as multiplying with a diagonal matrix
+        Xinv = (U * np.sqrt(s)) @ U.T
+    # S is factorized in double precision, the products run in C's precision
+    Xinv = Xinv.astype(C.dtype, copy=False)
+
+    C_ = Xinv.T @ C
+    F_ = (C_ * energies) @ C_.T
     F = Xinv @ F_ @ Xinv.T
     return F
 
 
-def read_mos(mol):
+def verify_tolerances(S, energies, dtype):
+    # Rounding to dtype perturbs F by about eps * max|e|, amplified by the
+    # conditioning of S (observed to grow roughly like sqrt(cond(S))).
+    # Eigenvalues move by that amount, eigenvectors by that amount over the
+    # smallest gap between (numerically) distinct eigenvalues.
+    eps = np.finfo(dtype).eps
+    s = sp.linalg.eigvalsh(S)
+    scale = float(np.abs(energies).max()) * np.sqrt(s[-1] / s[0])
+    gaps = np.diff(np.sort(energies))
+    gaps = gaps[gaps > eps * scale]
+    min_gap = gaps.min() if gaps.size else scale
+    atol_energies = max(VERIFY_SAFETY * eps * scale, VERIFY_MIN_ATOL)
+    atol_vectors = max(VERIFY_SAFETY * eps * scale / min_gap, VERIFY_MIN_ATOL)
+    return atol_energies, atol_vectors
+
+
+def read_mos(mol, dtype=np.float64):
     mos = mol["MolecularOrbitals"]["MOs"]
     nmos = len(mos)
-    C = np.empty((nmos, nmos))
-    energies = np.empty(nmos)
-    for i in range(nmos):
-        mo = mos[i]
-        C[:, i] = mo["MOCoefficients"]
-        energies[i] = mo["OrbitalEnergy"]
+    energies = np.fromiter(
+        (mo["OrbitalEnergy"] for mo in mos), dtype=dtype, count=nmos
+    )
+    # MOs are stored row-wise; the transposed view of the C-ordered array is
+    # already Fortran-ordered, so asfortranarray does not copy.
+    C = np.asfortranarray(
+        np.array([mo["MOCoefficients"] for mo in mos], dtype=dtype).T
+    )
     return energies, C
 
 
 def parse_args(args):
     parser = argparse.ArgumentParser()
-    parser.add_argument("json", help="Path to ORCA JSON file.")
+    parser.add_argument("json", nargs="+", help="Path(s) to ORCA JSON file(s).")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-diagonalize the reconstructed Fock matrix and compare.",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=("float32", "float64"),
+        default="float64",
+        help="Working precision of the MO data and the reconstructed F.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes when several files are given.",
+    )
     return parser.parse_args(args)
 
 
-def run():
-    args = parse_args(sys.argv[1:])
-
-    with open(args.json) as handle:
-        data = json.load(handle)
+def process_one(path, prefix, verify, dtype):
+    with open(path, "rb") as handle:
+        data = orjson.loads(handle.read())
     mol = data["Molecule"]
 
-    # Overlap matrix
-    S = np.array(mol["S-Matrix"])
+    # Overlap matrix; drop the nested lists right away to keep peak memory low
+    S = np.array(mol["S-Matrix"], dtype=np.float64)
+    del mol["S-Matrix"]
 
     # MO eigenvalues and -eigenvectors
-    energies, C = read_mos(mol)
+    energies, C = read_mos(mol, dtype=dtype)
 
     # Reconstructed Fock matrix
     F = reconstruct_fock(S, C, energies)
 
     # Check correctness of reconstructed F by diagonalization
-    energies_rec, C_rec = sp.linalg.eigh(F, S)
-    np.testing.assert_allclose(energies_rec, energies)
-    print("Reconstructed eigenvalues match!")
-    # Signs of eigenvalues may differ, so we can't compare them directly
-    # Assert that C^T @ S @ C is the unit matrix
-    I_rec = np.abs(C_rec.T @ S @ C)
-    # Matching is not ideal, max. abs. error is 8e-10
-    np.testing.assert_allclose(I_rec, np.eye(len(I_rec)), atol=1e-9)
-    print("Reconstructed eigenvectors match!")
-
-    np.save("S.npy", S)
-    np.save("F.npy", F)
+    if verify:
+        driver = "gvd" if len(S) >= DC_MIN_SIZE else None
+        atol_energies, atol_vectors = verify_tolerances(S, energies, dtype)
+        energies_rec, C_rec = sp.linalg.eigh(
+            F.astype(np.float64), S, driver=driver
+        )
+        np.testing.assert_allclose(energies_rec, energies, atol=atol_energies)
+        print(f"{path}: Reconstructed eigenvalues match!")
+        # Signs of eigenvalues may differ, so we can't compare them directly
+        # Assert that C^T @ S @ C is the unit matrix
+        I_rec = np.abs(C_rec.T @ S @ C)
+        # Matching is limited by rounding in dtype, amplified by small gaps
+        if atol_vectors > 0.1:
+            print(
+                f"{path}: Warning, eigenvectors can only be checked to "
+                f"{atol_vectors:.1e} in {dtype}"
+            )
+        np.testing.assert_allclose(I_rec, np.eye(len(I_rec)), atol=atol_vectors)
+        print(f"{path}: Reconstructed eigenvectors match!")
+
+    np.save(f"{prefix}S.npy", S, allow_pickle=False)  # S is always kept in float64
+    np.save(f"{prefix}F.npy", F, allow_pickle=False)
+    return path
+
+
+def output_prefixes(paths):
+    # A single input keeps the plain S.npy/F.npy names, several inputs get
+    # their file stem as prefix so they don't overwrite each other.
+    if len(paths) == 1:
+        return [""]
+    names = [Path(path).stem for path in paths]
+    if len(set(names)) < len(names):
+        # Same file name in different directories, keep the directories below
+        # the common parent in the prefix
+        resolved = [Path(path).resolve() for path in paths]
+        root = os.path.commonpath([r.parent for r in resolved])
+        names = ["_".join(r.relative_to(root).with_suffix("").parts) for r in resolved]
+    if len(set(names)) < len(names):
+        sys.exit("Inputs would write to the same output files, aborting.")
+    return [name + "_" for name in names]
+
+
+def run():
+    args = parse_args(sys.argv[1:])
+
+    prefixes = output_prefixes(args.json)
+    verify = [args.verify] * len(args.json)
+    dtypes = [args.dtype] * len(args.json)
+
+    if args.jobs > 1 and len(args.json) > 1:
+        # Separate processes instead of threads, so small matrices don't end up
+        # fighting over the BLAS thread pool.
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for path in pool.map(process_one, args.json, prefixes, verify, dtypes):
+                print(f"{path}: done")
+    else:
+        for path in map(process_one, args.json, prefixes, verify, dtypes):
+            print(f"{path}: done")
 
 
 if __name__ == "__main__":